@@ -1,19 +1,83 @@
+import io
 import os
 import json
 import asyncio
+import functools
+import hashlib
+import re
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel, Field
 import pdfplumber
 import fitz  # PyMuPDF
-from groq import Groq
+import pypdfium2 as pdfium
+import httpx
+from groq import AsyncGroq
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import logging
 
+try:
+    # uvicorn's "auto" loop already prefers uvloop; setting the policy here
+    # also covers direct `python app.py` runs and embedded use
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:  # pragma: no cover - uvloop ships with uvicorn[standard]
+    pass
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements
+    orjson = None
+
+if orjson is not None:
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+try:
+    from jiter import from_json as _jiter_from_json
+except ImportError:  # pragma: no cover - jiter is in requirements
+    _jiter_from_json = None
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover - xxhash is in requirements
+    xxhash = None
+
+if xxhash is not None:
+    def content_digest(data: bytes) -> bytes:
+        """128-bit content digest for cache keys and dedupe (not security)."""
+        return xxhash.xxh3_128_digest(data)
+else:
+    def content_digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+def parse_llm_json(content: str) -> Dict[str, Any]:
+    """Parse an LLM JSON payload.
+
+    jiter's key cache interns the field names ("severity", "quote", ...)
+    that repeat across every flag, which orjson and stdlib json
+    re-allocate per occurrence.
+    """
+    if _jiter_from_json is not None:
+        return _jiter_from_json(content.encode(), cache_mode="keys")
+    return json_loads(content)
+
 # Load environment variables
 load_dotenv()
 
@@ -35,6 +99,16 @@ app.add_middleware(
 
 # Configuration
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE_MB", 10)) * 1024 * 1024  # 10MB
+GROQ_MODEL = "llama3-70b-8192"
+CHUNK_MAX_TOKENS = 6000
+CHUNK_OVERLAP_TOKENS = 1000
+CHUNK_MAX_CHARS = 7000  # fallback when no tokenizer is available
+CHUNK_OVERLAP = 400
+MAX_CHUNKS = 3  # LLM call budget per document
+GROQ_MAX_CONCURRENCY = 8  # in-flight Groq calls across all requests
+LLM_CACHE_TTL = 24 * 3600  # seconds
+PROMPT_VERSION = "1"  # bump when SYSTEM_PROMPT/USER_PREFIX change to invalidate caches
+GROQ_TEMPERATURE = 0.1
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -45,11 +119,38 @@ if not GROQ_API_KEY:
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables are required")
 
-groq_client = Groq(api_key=GROQ_API_KEY)
+# One shared client for all LLM calls: keep-alive plus HTTP/2 multiplexing
+# avoids paying a TCP+TLS handshake per chunk request.
+groq_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=30.0,
+    ),
+)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Dedicated pool for CPU-bound PDF parsing, so it is not serialized
+# behind I/O work on Starlette's shared default threadpool
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="pdf")
+
+# Separate pool for per-page work inside an extraction; keeping it apart
+# from PDF_EXECUTOR means page tasks can never deadlock behind the
+# document tasks that spawned them
+PAGE_EXECUTOR = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4), thread_name_prefix="pdf-page")
+
+@app.on_event("shutdown")
+async def _shutdown_pdf_executor():
+    PDF_EXECUTOR.shutdown(wait=False)
+    PAGE_EXECUTOR.shutdown(wait=False)
+
 # Pydantic models
 class Evidence(BaseModel):
+    # Production builds these with model_construct, which skips
+    # validation; the quote cap is enforced by the [:600] slice in
+    # validate_and_postprocess, and max_length only re-checks it on
+    # explicitly validated paths
     page: int
     quote: str = Field(..., max_length=600)
 
@@ -75,63 +176,246 @@ class Report(BaseModel):
     ts: int
 
 # Utility functions
+def extract_text_with_pymupdf(file_content: bytes) -> str:
+    """Extract text with PyMuPDF (fastest, tried first).
+
+    Pages are extracted concurrently: get_text releases the GIL inside
+    MuPDF's C code, so a thread pool cuts extraction time by roughly the
+    core count on large PDFs. MuPDF documents are not thread-safe, so
+    each worker thread opens its own handle on the shared bytes.
+    """
+    doc = fitz.open(stream=file_content, filetype="pdf")
+    page_count = doc.page_count
+    if page_count <= 1:
+        text = doc[0].get_text() if page_count else ""
+        doc.close()
+        return f"[Page 1]\n{text}".strip() if text.strip() else ""
+    doc.close()
+
+    # One document handle per worker thread, scoped to this call; the
+    # shared pool's threads outlive the request, so a thread-local would
+    # leak stale handles between documents
+    docs: Dict[int, Any] = {}
+
+    def _page_text(page_num: int) -> str:
+        ident = threading.get_ident()
+        worker_doc = docs.get(ident)
+        if worker_doc is None:
+            worker_doc = docs[ident] = fitz.open(stream=file_content, filetype="pdf")
+        page_text = worker_doc.load_page(page_num).get_text("text")
+        # No marker for textless pages: a scanned PDF must extract to ""
+        # so the no-text 400 fires instead of analyzing bare page labels
+        return f"[Page {page_num + 1}]\n{page_text}" if page_text.strip() else ""
+
+    try:
+        parts = list(PAGE_EXECUTOR.map(_page_text, range(page_count)))
+    finally:
+        for worker_doc in docs.values():
+            worker_doc.close()
+    return "\n".join(part for part in parts if part).strip()
+
+def extract_text_with_pdfium(file_content: bytes) -> str:
+    """Extract text with pypdfium2's C-backed range extractor."""
+    pdf = pdfium.PdfDocument(file_content)
+    try:
+        parts = [
+            f"[Page {i + 1}]\n{page_text}"
+            for i, page in enumerate(pdf)
+            if (page_text := page.get_textpage().get_text_range()).strip()
+        ]
+    finally:
+        pdf.close()
+    return "\n\n".join(parts).strip()
+
+def extract_text_with_pdfplumber(file_content: bytes) -> str:
+    """Extract text with pdfplumber (slowest, last resort).
+
+    Pages are written into one StringIO buffer instead of repeated str
+    concatenation, which reallocates the accumulated text on every page.
+    """
+    with pdfplumber.open(io.BytesIO(file_content)) as pdf:
+        buf = io.StringIO()
+        for page_num, page in enumerate(pdf.pages, 1):
+            page_text = page.extract_text()
+            if page_text:
+                buf.write("[Page ")
+                buf.write(str(page_num))
+                buf.write("]\n")
+                buf.write(page_text)
+                buf.write("\n")
+        return buf.getvalue().strip()
+
+# Content-addressed extraction cache: re-uploads of the same bytes (common
+# while iterating on a document) skip the parse entirely
+_EXTRACT_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+_EXTRACT_CACHE_MAX = 32
+_extract_cache_lock = threading.Lock()
+
 def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF using both pdfplumber and PyMuPDF as fallback."""
+    """Extract text from PDF, trying PyMuPDF, then pypdfium2, then pdfplumber.
+
+    Results are cached by content hash. Fallbacks only run when an
+    extractor raises. An extractor that parses the document cleanly but
+    finds no text means a scanned/image PDF, and re-parsing with the
+    slower backends cannot do better.
+    """
+    digest = content_digest(file_content)
+    with _extract_cache_lock:
+        if digest in _EXTRACT_CACHE:
+            _EXTRACT_CACHE.move_to_end(digest)
+            return _EXTRACT_CACHE[digest]
+
+    for extractor in (extract_text_with_pymupdf, extract_text_with_pdfium, extract_text_with_pdfplumber):
+        try:
+            text = extractor(file_content)
+        except Exception as e:
+            logger.warning(f"{extractor.__name__} failed: {e}")
+            continue
+        with _extract_cache_lock:
+            _EXTRACT_CACHE[digest] = text
+            if len(_EXTRACT_CACHE) > _EXTRACT_CACHE_MAX:
+                _EXTRACT_CACHE.popitem(last=False)
+        return text
+
+    raise HTTPException(status_code=400, detail="Unable to extract text from PDF")
+
+def _chunk_bounds(n: int, window: int, overlap: int) -> List[tuple]:
+    """Compute (start, end) window indices in one integer-only pass."""
+    bounds = []
+    start = 0
+    while start < n:
+        end = start + window
+        if end >= n:
+            bounds.append((start, n))
+            break
+        bounds.append((start, end))
+        start = end - overlap
+    return bounds
+
+@functools.lru_cache(maxsize=1)
+def _get_tokenizer():
+    """Load and cache the tokenizer; warmed once at startup."""
     try:
-        # Try pdfplumber first
-        import io
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            if text.strip():
-                return text.strip()
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
     except Exception as e:
-        logger.warning(f"pdfplumber failed: {e}")
-    
+        logger.warning(f"tiktoken unavailable, falling back to character chunking: {e}")
+        return None
+
+@app.on_event("startup")
+async def _warm_tokenizer():
+    # get_encoding fetches the BPE ranks over the network on first use
+    # (or stalls on DNS failure); pay that here, off the event loop,
+    # instead of inside whichever request calls chunk_text first
+    await asyncio.get_running_loop().run_in_executor(PDF_EXECUTOR, _get_tokenizer)
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into overlapping windows so each fits in one LLM call.
+
+    Groq bills and rate-limits on tokens, so windows are measured in
+    tokens when a tokenizer is available; character windows only
+    approximate the context budget and are kept as a fallback.
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        ids = tokenizer.encode(text)
+        if len(ids) <= CHUNK_MAX_TOKENS:
+            return [text]
+        return [
+            tokenizer.decode(ids[start:end])
+            for start, end in _chunk_bounds(len(ids), CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+        ]
+
+    if len(text) <= max_chars:
+        return [text]
+    return [text[start:end] for start, end in _chunk_bounds(len(text), max_chars, overlap)]
+
+_COMPLIANCE_KEYWORDS = (
+    "aml", "kyc", "sanction", "gdpr", "pdpa", "cross-border", "cross border",
+    "jurisdiction", "money launder", "fatf", "ofac",
+)
+
+_COMPLIANCE_KWS = re.compile(
+    r"\b(AML|KYC|sanction|GDPR|PDPA|cross[- ]border|jurisdiction|money launder|FATF|OFAC)\b",
+    re.IGNORECASE,
+)
+
+def _build_kw_automaton():
+    """Build an Aho-Corasick automaton over the compliance keywords.
+
+    One DFA pass over the chunk replaces per-keyword substring scans.
+    pyahocorasick is optional; without it scoring falls back to the
+    regex union above.
+    """
     try:
-        # Fallback to PyMuPDF
-        doc = fitz.open(stream=file_content, filetype="pdf")
-        text = ""
-        for page_num in range(doc.page_count):
-            page = doc[page_num]
-            text += page.get_text() + "\n"
-        doc.close()
-        return text.strip()
-    except Exception as e:
-        logger.error(f"PyMuPDF also failed: {e}")
-        raise HTTPException(status_code=400, detail="Unable to extract text from PDF")
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for kw in _COMPLIANCE_KEYWORDS:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+    return automaton
 
-def analyze_chunks(text: str, filename: str) -> AnalysisResult:
-    """Analyze text using Groq LLM and return structured compliance report."""
-    
-    # Truncate text if too long (keep first 50k chars for now)
-    if len(text) > 50000:
-        text = text[:50000] + "\n\n[Text truncated for analysis...]"
-    
-    prompt = f"""
-Analyze the following financial/legal document for compliance issues. Return a JSON response with this exact structure:
+_KW_AUTOMATON = _build_kw_automaton()
+
+def _score_chunk(chunk: str) -> int:
+    """Count compliance-keyword hits; a relative score for ranking only."""
+    if _KW_AUTOMATON is not None:
+        return sum(1 for _ in _KW_AUTOMATON.iter(chunk.lower()))
+    return len(_COMPLIANCE_KWS.findall(chunk))
+
+def select_chunks(chunks: List[str], budget: int = MAX_CHUNKS) -> List[str]:
+    """Pick which chunks are worth an LLM call.
+
+    Drops duplicate chunks (repeated boilerplate) and, when the document
+    has more chunks than the call budget, spends the budget on the
+    chunks densest in compliance keywords rather than blindly taking the
+    first ones, which are often cover pages and tables of contents.
+    """
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        digest = content_digest(chunk.encode())
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(chunk)
+
+    if len(unique) <= budget:
+        return unique
+
+    scores = [_score_chunk(chunk) for chunk in unique]
+    if not any(scores):
+        return unique[:budget]
 
-{{
+    # Top-scoring chunks, kept in document order
+    top = sorted(sorted(range(len(unique)), key=scores.__getitem__, reverse=True)[:budget])
+    return [unique[i] for i in top]
+
+# Module-level constants: a byte-identical prompt prefix across calls lets
+# Groq's server-side prefix/KV cache reuse work, since only the trailing
+# chunk differs between the chunk calls of a document
+SYSTEM_PROMPT = """You are an expert compliance analyst.
+Analyze the financial/legal document provided by the user for compliance issues. Return a JSON response with this exact structure:
+
+{
   "summary": "Executive summary of the document and key compliance findings",
   "overall_risk": 75.5,
   "flags": [
-    {{
+    {
       "title": "Cross-Border Transaction Risk",
       "severity": 4,
       "why_it_matters": "This transaction involves multiple jurisdictions with different regulatory requirements",
       "recommendation": "Conduct thorough due diligence on all parties and ensure compliance with all applicable regulations",
       "evidence": [
-        {{
+        {
           "page": 1,
           "quote": "Transaction involves entities in US, EU, and Singapore..."
-        }}
+        }
       ]
-    }}
+    }
   ]
-}}
+}
 
 Focus on these compliance areas:
 - Anti-Money Laundering (AML)
@@ -141,68 +425,436 @@ Focus on these compliance areas:
 - Financial regulations
 - Risk management
 
-Document: {filename}
-Content:
-{text}
-
 Return only valid JSON, no additional text.
 """
 
+USER_PREFIX = "Document: "
+
+def build_prompt(chunk: str, filename: str) -> List[Dict[str, str]]:
+    """Build the chat messages for a single chunk, variable part last."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{USER_PREFIX}{filename}\nContent:\n{chunk}"},
+    ]
+
+# Compiled once: these run on every LLM response
+_FENCE_START = re.compile(r"^```[a-zA-Z]*\s*")
+_FENCE_END = re.compile(r"```\s*$")
+_JSON_OBJ = re.compile(r"\{.*\}", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+def sse_event(data: Dict[str, Any]) -> str:
+    """Serialize one SSE frame."""
+    return f"data: {json_dumps(data)}\n\n"
+
+# Fixed progress frames, serialized once at import instead of per stream
+_SSE_INGEST = sse_event({'stage': 'ingest', 'message': 'Processing uploaded file...'})
+_SSE_EXTRACT = sse_event({'stage': 'extract', 'message': 'Extracting text from PDF...'})
+_SSE_ANALYZE = sse_event({'stage': 'analyze', 'message': 'Analyzing compliance issues with Groq AI...'})
+_SSE_NO_TEXT = sse_event({'stage': 'error', 'message': 'No text found in PDF'})
+
+def force_parse_json(content: str) -> Dict[str, Any]:
+    """Parse the LLM response into a dict, recovering JSON wrapped in prose."""
     try:
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=4000
+        return json_loads(content)
+    except ValueError:
+        # Strip markdown fences, extract the JSON object, repair trailing commas
+        cleaned = _FENCE_END.sub("", _FENCE_START.sub("", content.strip()))
+        json_match = _JSON_OBJ.search(cleaned)
+        if json_match:
+            return json_loads(_TRAILING_COMMA.sub(r"\1", json_match.group()))
+        raise ValueError("No valid JSON found in response")
+
+# Structural schema for the LLM response, compiled to straight-line Python
+# once at import. Range and length limits deliberately stay out of it:
+# out-of-range LLM output is clamped below, not rejected and re-requested.
+_LLM_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "overall_risk": {"type": ["number", "null"]},
+        "flags": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "severity": {"type": "number"},
+                    "why_it_matters": {"type": "string"},
+                    "recommendation": {"type": "string"},
+                    "evidence": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "page": {"type": "number"},
+                                "quote": {"type": "string"},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+}
+
+try:
+    import fastjsonschema
+    _validate_llm_response = fastjsonschema.compile(_LLM_RESPONSE_SCHEMA)
+except ImportError:  # pragma: no cover - fastjsonschema is in requirements
+    _validate_llm_response = None
+
+def validate_and_postprocess(data: Dict[str, Any]) -> AnalysisResult:
+    """Validate and structure a parsed LLM response.
+
+    One compiled schema pass checks the shape, after which the models
+    are built with model_construct — the clamp/truncate normalization
+    below is the only per-field work, with no Pydantic re-validation.
+    Schema violations raise ValueError, feeding the caller's retry loop.
+    """
+    if _validate_llm_response is not None:
+        _validate_llm_response(data)
+
+    # One comprehension pass: clamp, truncate and construct in place
+    flags = [
+        ComplianceFlag.model_construct(
+            title=flag_data.get("title", "Unknown Issue"),
+            severity=max(1, min(5, int(flag_data.get("severity", 3)))),
+            why_it_matters=flag_data.get("why_it_matters", ""),
+            recommendation=flag_data.get("recommendation", ""),
+            evidence=[
+                Evidence.model_construct(
+                    page=int(ev.get("page", 1)),
+                    quote=(ev.get("quote", "") or "")[:600]
+                )
+                for ev in flag_data.get("evidence", [])
+            ]
         )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Try to parse JSON
+        for flag_data in data.get("flags", [])
+    ]
+
+    # Missing risk falls back to average severity; no flags means no risk
+    overall_risk = data.get("overall_risk")
+    if overall_risk is None:
+        overall_risk = (sum(flag.severity for flag in flags) / len(flags) / 5 * 100) if flags else 0.0
+    overall_risk = 0.0 if overall_risk < 0 else 100.0 if overall_risk > 100 else float(overall_risk)
+
+    return AnalysisResult.model_construct(
+        summary=data.get("summary", "Analysis completed"),
+        overall_risk=overall_risk,
+        flags=flags
+    )
+
+# Exact-match LLM response cache. Re-uploaded and templated compliance
+# documents produce identical chunks, so hits skip the Groq round-trip.
+# Bounded LRU: expired entries are dropped on read, the oldest on insert.
+_llm_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_LLM_CACHE_MAX = 512
+
+# Groq has no multi-prompt batch endpoint, so concurrent chunks fan out as
+# individual calls; this gate keeps overlapping uploads from stampeding the
+# shared HTTP/2 pool while still letting calls overlap their network RTT.
+_groq_gate = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+def _llm_cache_key(chunk: str) -> bytes:
+    return content_digest(f"{GROQ_MODEL}|{GROQ_TEMPERATURE}|{PROMPT_VERSION}|{chunk}".encode())
+
+async def call_groq_json(chunk: str, filename: str, cache: bool = True) -> AnalysisResult:
+    """Run one chunk through Groq and return a validated result.
+
+    One shared call/parse/validate path serves both the primary attempt
+    and the low-temperature retry, so retry behavior lives in a single
+    loop instead of a duplicated except block. JSON mode makes Groq
+    return a bare JSON object, so the regex repair in force_parse_json
+    is only a fallback.
+    """
+    key = _llm_cache_key(chunk)
+    if cache:
+        cached = _llm_cache.get(key)
+        if cached:
+            if cached[0] > time.time():
+                _llm_cache.move_to_end(key)
+                return cached[1].model_copy(deep=True)
+            del _llm_cache[key]
+
+    messages = build_prompt(chunk, filename)
+    attempts = [GROQ_TEMPERATURE, 0.0]
+
+    last_error = None
+    for attempt, temperature in enumerate(attempts):
+        if attempt:
+            await asyncio.sleep(0.2 * attempt)
         try:
-            data = json.loads(content)
-        except json.JSONDecodeError:
-            # Try to extract JSON from response
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-            else:
-                raise ValueError("No valid JSON found in response")
-        
-        # Validate and structure the response
-        flags = []
-        for flag_data in data.get("flags", []):
-            evidence = []
-            for ev in flag_data.get("evidence", []):
-                evidence.append(Evidence(
-                    page=ev.get("page", 1),
-                    quote=ev.get("quote", "")[:600]  # Ensure max 600 chars
-                ))
-            
-            flags.append(ComplianceFlag(
-                title=flag_data.get("title", "Unknown Issue"),
-                severity=max(1, min(5, flag_data.get("severity", 3))),
-                why_it_matters=flag_data.get("why_it_matters", ""),
-                recommendation=flag_data.get("recommendation", ""),
-                evidence=evidence
-            ))
-        
-        # Calculate overall risk if not provided
-        overall_risk = data.get("overall_risk")
-        if overall_risk is None and flags:
-            avg_severity = sum(flag.severity for flag in flags) / len(flags)
-            overall_risk = (avg_severity / 5) * 100
-        
-        return AnalysisResult(
-            summary=data.get("summary", "Analysis completed"),
-            overall_risk=min(100, max(0, overall_risk or 0)),
-            flags=flags
+            async with _groq_gate:
+                response = await groq_client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=4000,
+                    response_format={"type": "json_object"}
+                )
+            content = (response.choices[0].message.content or "").strip()
+            try:
+                data = parse_llm_json(content)
+            except ValueError:
+                data = force_parse_json(content)
+            result = validate_and_postprocess(data)
+            break
+        except Exception as e:
+            last_error = e
+    else:
+        raise last_error
+
+    if cache:
+        _llm_cache[key] = (time.time() + LLM_CACHE_TTL, result.model_copy(deep=True))
+        if len(_llm_cache) > _LLM_CACHE_MAX:
+            _llm_cache.popitem(last=False)
+    return result
+
+async def call_groq_stream(chunk: str, filename: str):
+    """Stream one chunk's analysis as ("delta", text) frames plus a final
+    ("result", AnalysisResult).
+
+    Forwarding Groq's token stream lets the client render output at
+    first-token latency instead of waiting for the full completion. Groq
+    rejects JSON mode together with stream=True, so this path leans on
+    force_parse_json for cleanup instead.
+    """
+    key = _llm_cache_key(chunk)
+    cached = _llm_cache.get(key)
+    if cached:
+        if cached[0] > time.time():
+            _llm_cache.move_to_end(key)
+            yield "result", cached[1].model_copy(deep=True)
+            return
+        del _llm_cache[key]
+
+    messages = build_prompt(chunk, filename)
+    parts: List[str] = []
+    async with _groq_gate:
+        stream = await groq_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            temperature=GROQ_TEMPERATURE,
+            max_tokens=4000,
+            stream=True
         )
-        
+        async for piece in stream:
+            delta = piece.choices[0].delta.content if piece.choices else None
+            if delta:
+                parts.append(delta)
+                yield "delta", delta
+
+    content = "".join(parts).strip()
+    try:
+        data = parse_llm_json(content)
+    except ValueError:
+        data = force_parse_json(content)
+    result = validate_and_postprocess(data)
+    _llm_cache[key] = (time.time() + LLM_CACHE_TTL, result.model_copy(deep=True))
+    if len(_llm_cache) > _LLM_CACHE_MAX:
+        _llm_cache.popitem(last=False)
+    yield "result", result
+
+def merge_results(results: List[AnalysisResult]) -> AnalysisResult:
+    """Merge per-chunk results into one report.
+
+    Overlapping chunks flag the same risk repeatedly; collapse flags on
+    (title, severity) and keep the union of their evidence instead of
+    inflating the report with duplicates.
+    """
+    if len(results) == 1:
+        return results[0]
+
+    merged: Dict[tuple, ComplianceFlag] = {}
+    for result in results:
+        for flag in result.flags:
+            key = (flag.title.lower().strip(), flag.severity)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = flag
+            else:
+                seen = {(ev.page, ev.quote[:80]) for ev in existing.evidence}
+                existing.evidence.extend(
+                    ev for ev in flag.evidence if (ev.page, ev.quote[:80]) not in seen
+                )
+
+    # Inputs were validated per chunk, so skip Pydantic re-validation here
+    flags = list(merged.values())
+    overall_risk = sum(result.overall_risk for result in results) / len(results)
+    return AnalysisResult.model_construct(
+        summary=" ".join(result.summary for result in results),
+        overall_risk=min(100.0, max(0.0, overall_risk)),
+        flags=flags
+    )
+
+# Document-level result cache: re-analyses of the same extracted text
+# (demo re-clicks, repeated uploads) skip chunking and every Groq call.
+# Bounded LRU like _llm_cache, but whole-document results are larger.
+_doc_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_DOC_CACHE_MAX = 256
+
+def _doc_cache_key(text: str) -> bytes:
+    return content_digest(f"{GROQ_MODEL}|{PROMPT_VERSION}|".encode() + text.encode())
+
+async def analyze_chunks(text: str, filename: str) -> AnalysisResult:
+    """Analyze text using Groq LLM and return structured compliance report.
+
+    Long documents are split into chunks and all chunk requests are issued
+    concurrently, so wall-clock time is one LLM round-trip instead of one
+    per chunk. Whole-document results are memoized by content hash and
+    prompt version, so identical re-analyses return without any LLM call.
+    """
+    key = _doc_cache_key(text)
+    cached = _doc_cache.get(key)
+    if cached:
+        if cached[0] > time.time():
+            _doc_cache.move_to_end(key)
+            return cached[1].model_copy(deep=True)
+        del _doc_cache[key]
+
+    chunks = select_chunks(chunk_text(text))
+    results = await asyncio.gather(
+        *(call_groq_json(chunk, filename) for chunk in chunks),
+        return_exceptions=True
+    )
+
+    ok = [r for r in results if isinstance(r, AnalysisResult)]
+    if not ok:
+        error = next(r for r in results if isinstance(r, Exception))
+        logger.error(f"Groq analysis failed: {error}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(error)}")
+
+    result = merge_results(ok)
+    _doc_cache[key] = (time.time() + LLM_CACHE_TTL, result.model_copy(deep=True))
+    if len(_doc_cache) > _DOC_CACHE_MAX:
+        _doc_cache.popitem(last=False)
+    return result
+
+async def analyze_chunks_stream(chunks: List[str], filename: str):
+    """Yield each chunk's result as soon as its Groq call completes.
+
+    Lets the SSE endpoint surface the first flags after one LLM
+    round-trip instead of waiting for the slowest chunk.
+    """
+    tasks = [asyncio.ensure_future(call_groq_json(chunk, filename)) for chunk in chunks]
+    for future in asyncio.as_completed(tasks):
+        try:
+            yield await future
+        except Exception as e:
+            logger.warning(f"Chunk analysis failed: {e}")
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read the upload, enforcing the size cap and the PDF magic bytes.
+
+    Starlette has already received and spooled the whole multipart body
+    by the time the handler runs, so this cannot refuse an oversize POST
+    mid-transfer; what the incremental read buys is bailing out of the
+    spool-to-memory copy at the first excess (or non-PDF) chunk instead
+    of materializing the full body first. A body that is not a PDF is
+    rejected on its first bytes regardless of the uploaded filename.
+    """
+    buf = bytearray()
+    magic_checked = False
+    while True:
+        chunk = await file.read(1 << 20)
+        if not chunk:
+            break
+        buf.extend(chunk)
+        if not magic_checked and len(buf) >= 5:
+            magic_checked = True
+            if not buf.startswith(b"%PDF-"):
+                raise HTTPException(status_code=400, detail="File is not a valid PDF")
+        if len(buf) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB")
+
+    if not buf:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if not magic_checked:  # body shorter than the magic itself
+        raise HTTPException(status_code=400, detail="File is not a valid PDF")
+    return bytes(buf)
+
+# Report rows are queued and drained by a background writer so bursts of
+# analyses share one Supabase round-trip instead of paying one each
+REPORT_BATCH_MAX = 32
+_report_queue: Optional[asyncio.Queue] = None
+_report_loop: Optional[asyncio.AbstractEventLoop] = None
+# Module-level handle: an unreferenced task can be garbage-collected
+# mid-flight, and shutdown needs it to cancel and flush
+_report_task: Optional[asyncio.Task] = None
+
+async def _report_writer() -> None:
+    """Drain queued report rows, batching waiting rows into one insert."""
+    while True:
+        rows = [await _report_queue.get()]
+        while len(rows) < REPORT_BATCH_MAX:
+            try:
+                rows.append(_report_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        try:
+            await asyncio.to_thread(lambda: supabase.table("reports").insert(rows).execute())
+        except Exception as e:
+            logger.error(f"Failed to save {len(rows)} report(s): {e}")
+
+@app.on_event("startup")
+async def _start_report_writer():
+    global _report_queue, _report_loop, _report_task
+    _report_queue = asyncio.Queue()
+    _report_loop = asyncio.get_running_loop()
+    _report_task = asyncio.create_task(_report_writer())
+
+@app.on_event("shutdown")
+async def _stop_report_writer():
+    """Cancel the writer and flush rows still queued with one last insert."""
+    global _report_queue, _report_loop, _report_task
+    if _report_task is None:
+        return
+    _report_task.cancel()
+    try:
+        await _report_task
+    except asyncio.CancelledError:
+        pass
+    rows = []
+    while True:
+        try:
+            rows.append(_report_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    if rows:
+        try:
+            await asyncio.to_thread(lambda: supabase.table("reports").insert(rows).execute())
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} report(s) at shutdown: {e}")
+    _report_queue = None
+    _report_loop = None
+    _report_task = None
+
+def _build_report_row(user_id: str, doc_name: str, result: AnalysisResult) -> Dict[str, Any]:
+    return Report(
+        user_id=user_id,
+        doc_name=doc_name,
+        summary=result.summary,
+        overall_risk=result.overall_risk,
+        flags=result.flags,
+        ts=int(time.time())
+    ).model_dump(mode="json")
+
+def save_report(user_id: str, doc_name: str, result: AnalysisResult) -> None:
+    """Queue a report row for the background writer.
+
+    Callers may run on worker threads, so hand-off goes through
+    call_soon_threadsafe. Outside the app lifecycle (no writer running)
+    this degrades to a direct insert; failures are logged, not surfaced.
+    """
+    try:
+        row = _build_report_row(user_id, doc_name, result)
+        if _report_queue is not None and _report_loop is not None:
+            _report_loop.call_soon_threadsafe(_report_queue.put_nowait, row)
+        else:
+            supabase.table("reports").insert(row).execute()
     except Exception as e:
-        logger.error(f"Groq analysis failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        logger.error(f"Failed to save report: {e}")
 
 # API Endpoints
 @app.get("/")
@@ -210,46 +862,30 @@ async def root():
     return {"message": "AI Compliance Copilot API", "version": "1.0.0"}
 
 @app.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Analyze a PDF document for compliance issues."""
     
     # Validate file
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Check file size
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB")
-    
-    if len(file_content) == 0:
-        raise HTTPException(status_code=400, detail="Empty file")
-    
+    # Size cap, emptiness and PDF magic are enforced in read_upload
+    file_content = await read_upload(file)
+
     try:
-        # Extract text
-        text = extract_text_from_pdf(file_content)
+        # Extract text off the event loop
+        text = await asyncio.get_running_loop().run_in_executor(
+            PDF_EXECUTOR, extract_text_from_pdf, file_content
+        )
         if not text.strip():
             raise HTTPException(status_code=400, detail="No text found in PDF")
         
         # Analyze
-        result = analyze_chunks(text, file.filename)
-        
-        # Save to database
-        report = Report(
-            user_id="demo_user",  # In production, get from auth
-            doc_name=file.filename,
-            summary=result.summary,
-            overall_risk=result.overall_risk,
-            flags=result.flags,
-            ts=int(time.time())
-        )
-        
-        # Convert to dict for Supabase
-        report_dict = report.dict()
-        report_dict["flags"] = [flag.dict() for flag in result.flags]
-        
-        supabase.table("reports").insert(report_dict).execute()
+        result = await analyze_chunks(text, file.filename)
         
+        # Save after the response is sent; the client never waits on Supabase
+        background_tasks.add_task(save_report, "demo_user", file.filename, result)  # In production, get user from auth
+
         return result
         
     except HTTPException:
@@ -266,54 +902,66 @@ async def analyze_document_sse(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Check file size
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB")
-    
-    if len(file_content) == 0:
-        raise HTTPException(status_code=400, detail="Empty file")
-    
+    # Size cap, emptiness and PDF magic are enforced in read_upload
+    file_content = await read_upload(file)
+
     async def generate_events():
         try:
             # Stage 1: Ingest
-            yield f"data: {json.dumps({'stage': 'ingest', 'message': 'Processing uploaded file...'})}\n\n"
+            yield _SSE_INGEST
             await asyncio.sleep(0.5)
-            
+
             # Stage 2: Extract
-            yield f"data: {json.dumps({'stage': 'extract', 'message': 'Extracting text from PDF...'})}\n\n"
-            text = extract_text_from_pdf(file_content)
+            yield _SSE_EXTRACT
+            text = await asyncio.get_running_loop().run_in_executor(
+                PDF_EXECUTOR, extract_text_from_pdf, file_content
+            )
             if not text.strip():
-                yield f"data: {json.dumps({'stage': 'error', 'message': 'No text found in PDF'})}\n\n"
+                yield _SSE_NO_TEXT
                 return
-            
+
             await asyncio.sleep(0.5)
-            
-            # Stage 3: Analyze
-            yield f"data: {json.dumps({'stage': 'analyze', 'message': 'Analyzing compliance issues with Groq AI...'})}\n\n"
-            result = analyze_chunks(text, file.filename)
-            
+
+            # Stage 3: Analyze, emitting each chunk's flags as they arrive
+            yield _SSE_ANALYZE
+            chunks = select_chunks(chunk_text(text))
+            partials = []
+            if len(chunks) == 1:
+                # Single chunk: forward Groq's token stream so the client
+                # sees output at first-token latency. Multi-chunk calls run
+                # concurrently, so their deltas would interleave unreadably.
+                try:
+                    async for kind, payload in call_groq_stream(chunks[0], file.filename):
+                        if kind == "delta":
+                            yield sse_event({'stage': 'token', 'delta': payload})
+                        else:
+                            partials.append(payload)
+                except Exception as e:
+                    logger.warning(f"Token streaming failed, retrying buffered: {e}")
+                    try:
+                        partials.append(await call_groq_json(chunks[0], file.filename))
+                    except Exception as e:
+                        logger.warning(f"Chunk analysis failed: {e}")
+            else:
+                async for partial in analyze_chunks_stream(chunks, file.filename):
+                    partials.append(partial)
+                    yield sse_event({'stage': 'partial', 'message': f'Analyzed chunk {len(partials)} of {len(chunks)}', 'result': partial.model_dump()})
+
+            if not partials:
+                yield sse_event({'stage': 'error', 'message': 'Analysis failed for all chunks'})
+                return
+            result = merge_results(partials)
+
             # Stage 4: Done
-            yield f"data: {json.dumps({'stage': 'done', 'message': 'Analysis complete', 'result': result.dict()})}\n\n"
-            
-            # Save to database
-            report = Report(
-                user_id="demo_user",
-                doc_name=file.filename,
-                summary=result.summary,
-                overall_risk=result.overall_risk,
-                flags=result.flags,
-                ts=int(time.time())
-            )
-            
-            report_dict = report.dict()
-            report_dict["flags"] = [flag.dict() for flag in result.flags]
-            
-            supabase.table("reports").insert(report_dict).execute()
+            yield sse_event({'stage': 'done', 'message': 'Analysis complete', 'result': result.model_dump()})
             
+            # save_report only enqueues for the background writer, so the
+            # call is non-blocking and needs no task or thread of its own
+            save_report("demo_user", file.filename, result)
+
         except Exception as e:
             logger.error(f"SSE analysis error: {e}")
-            yield f"data: {json.dumps({'stage': 'error', 'message': str(e)})}\n\n"
+            yield sse_event({'stage': 'error', 'message': str(e)})
     
     return StreamingResponse(
         generate_events(),
@@ -324,24 +972,62 @@ async def analyze_document_sse(file: UploadFile = File(...)):
         }
     )
 
+# Short-TTL cache for the report list: dashboards poll this endpoint in
+# bursts, and a few seconds of staleness is invisible next to the
+# background writer's own insert latency. Bounded LRU because user_id
+# comes straight from the query string, so growth is caller-controlled.
+_REPORTS_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_REPORTS_CACHE_MAX = 1024
+REPORTS_CACHE_TTL = 5.0
+
 @app.get("/reports")
 async def get_reports(user_id: str = "demo_user"):
     """Get all reports for a user."""
+    cached = _REPORTS_CACHE.get(user_id)
+    if cached:
+        if cached[0] > time.time():
+            _REPORTS_CACHE.move_to_end(user_id)
+            return {"reports": cached[1]}
+        del _REPORTS_CACHE[user_id]
     try:
-        response = supabase.table("reports").select("*").eq("user_id", user_id).order("ts", desc=True).execute()
+        # supabase-py is sync HTTP; keep it off the event loop
+        response = await asyncio.to_thread(
+            lambda: supabase.table("reports").select("*").eq("user_id", user_id).order("ts", desc=True).execute()
+        )
+        _REPORTS_CACHE[user_id] = (time.time() + REPORTS_CACHE_TTL, response.data)
+        if len(_REPORTS_CACHE) > _REPORTS_CACHE_MAX:
+            _REPORTS_CACHE.popitem(last=False)
         return {"reports": response.data}
     except Exception as e:
         logger.error(f"Error fetching reports: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch reports")
 
+# Individual reports are append-only, so a fetched row stays valid; a
+# bounded LRU with a long TTL turns repeat detail views into memory hits
+_REPORT_CACHE: "OrderedDict[int, tuple]" = OrderedDict()
+_REPORT_CACHE_MAX = 1024
+REPORT_CACHE_TTL = 3600.0
+
 @app.get("/reports/{report_id}")
 async def get_report(report_id: int):
     """Get a specific report by ID."""
+    cached = _REPORT_CACHE.get(report_id)
+    if cached and cached[0] > time.time():
+        _REPORT_CACHE.move_to_end(report_id)
+        return cached[1]
     try:
-        response = supabase.table("reports").select("*").eq("id", report_id).execute()
+        response = await asyncio.to_thread(
+            lambda: supabase.table("reports").select("*").eq("id", report_id).execute()
+        )
         if not response.data:
             raise HTTPException(status_code=404, detail="Report not found")
-        return response.data[0]
+        report = response.data[0]
+        _REPORT_CACHE[report_id] = (time.time() + REPORT_CACHE_TTL, report)
+        if len(_REPORT_CACHE) > _REPORT_CACHE_MAX:
+            _REPORT_CACHE.popitem(last=False)
+        return report
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching report: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch report")